@@ -2,34 +2,168 @@
 Simplified SecureDealzBot - Clean version for Railway deployment
 """
 import os
+import queue
+import time
+import string
+import atexit
 import asyncio
+import functools
 import logging
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
-from models import db, User, Deal, Transaction, DealStatus
-
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+from telegram.ext import AIORateLimiter, Application, CommandHandler, CallbackQueryHandler, ContextTypes
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from models import db, User
+
+try:
+    import uvloop
+except ImportError:  # optional - not available on Windows
+    uvloop = None
+
+
+class SecretFilter(logging.Filter):
+    """Redact registered secrets and drop repeats of a record within a short window"""
+
+    def __init__(self, window=5.0, max_tracked=1024):
+        super().__init__()
+        self.secrets = set()
+        self.window = window
+        self.max_tracked = max_tracked
+        # Oldest first, so expired entries (and overflow past max_tracked) pop from the front
+        self._last_seen = OrderedDict()
+
+    def filter(self, record):
+        message = record.getMessage()
+        for secret in self.secrets:
+            if secret in message:
+                message = message.replace(secret, '[REDACTED]')
+        record.msg, record.args = message, None
+
+        cutoff = record.created - self.window
+        while self._last_seen:
+            oldest_seen = next(iter(self._last_seen.values()))
+            if oldest_seen >= cutoff and len(self._last_seen) < self.max_tracked:
+                break
+            self._last_seen.popitem(last=False)
+
+        key = (record.name, record.levelno, message)
+        last_seen = self._last_seen.get(key)
+        if last_seen is not None and record.created - last_seen < self.window:
+            return False
+        self._last_seen[key] = record.created
+        self._last_seen.move_to_end(key)
+        return True
+
+
+secret_filter = SecretFilter()
+
+
+class CachedTimeFormatter(logging.Formatter):
+    """Formatter that renders asctime once per second instead of once per record"""
+
+    _last_second = None
+    _last_asctime = ''
+
+    def formatTime(self, record, datefmt=None):
+        second = int(record.created)
+        if second != self._last_second:
+            self._last_second = second
+            self._last_asctime = time.strftime(datefmt or self.default_time_format, self.converter(record.created))
+        if datefmt:
+            return self._last_asctime
+        return self.default_msec_format % (self._last_asctime, record.msecs)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of raising"""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        # Called under the handler lock, so the counter needs no extra locking
+        try:
+            if self.dropped:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    'name': __name__,
+                    'levelno': logging.WARNING,
+                    'levelname': 'WARNING',
+                    'msg': "⚠️ Log queue full - dropped %d records",
+                    'args': (self.dropped,),
+                }))
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# Configure logging - handlers only enqueue records, a background listener
+# thread does the actual (blocking) stream writes
+def configure_logging():
+    """Install the queue-based root handler once; repeated calls are no-ops"""
+    root = logging.getLogger()
+    if any(isinstance(handler, QueueHandler) for handler in root.handlers):
+        return None
+
+    log_queue = queue.Queue(maxsize=10000)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(CachedTimeFormatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    # Filters on the listener's handler run on the listener thread, off the hot path
+    stream_handler.addFilter(secret_filter)
+    root.setLevel(logging.INFO)
+    # Replace (rather than add to) any handlers installed by basicConfig so
+    # every record takes exactly one path
+    root.handlers = [DroppingQueueHandler(log_queue)]
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+log_listener = configure_logging()
 logger = logging.getLogger(__name__)
 
+# Library loggers emit several INFO records per update - keep them quiet in production
+_TG_LOG = logging.getLogger('telegram')
+_TGEXT_LOG = logging.getLogger('telegram.ext')
+_HTTPX_LOG = logging.getLogger('httpx')
+_library_log_level = logging.WARNING if os.environ.get("ENV") == "production" else logging.INFO
+_TG_LOG.setLevel(_library_log_level)
+_TGEXT_LOG.setLevel(_library_log_level)
+# httpx logs every Bot API request (including the token-bearing URL) at INFO
+_HTTPX_LOG.setLevel(logging.WARNING)
+
 # Bot token
-BOT_TOKEN = os.environ.get("BOT_TOKEN")
+_TOKEN_CHARS = frozenset(string.ascii_letters + string.digits + '_-')
 
-class SimpleBotHandler:
-    def __init__(self, flask_app):
-        self.flask_app = flask_app
-        
-    async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /start command"""
-        try:
-            user = update.effective_user
-            chat_id = update.effective_chat.id
-            
-            # Create welcome message
-            welcome_msg = """
+
+def _is_valid_token(token):
+    """Check the <bot_id>:<secret> shape of a Bot API token"""
+    bot_id, sep, secret = token.partition(':')
+    return bool(sep) and bot_id.isdigit() and bool(secret) and _TOKEN_CHARS.issuperset(secret)
+
+
+@functools.cache
+def _load_bot_token():
+    """Read and validate BOT_TOKEN from the environment (once per process)"""
+    token = os.environ.get("BOT_TOKEN", "").strip()
+    if not token:
+        return None
+    if not _is_valid_token(token):
+        logger.error("❌ BOT_TOKEN has an invalid format (expected <bot_id>:<secret>)")
+        return None
+    secret_filter.secrets.add(token)
+    if logger.isEnabledFor(logging.INFO):
+        # Log a short fingerprint so deployments can tell tokens apart - never the token itself
+        import hashlib
+        logger.info("🔑 BOT_TOKEN loaded (sha256:%s)", hashlib.sha256(token.encode()).hexdigest()[:8])
+    return token
+
+
+BOT_TOKEN = _load_bot_token()
+
+# /start welcome message
+WELCOME_TEXT = """
 🎯 **Welcome to SecureDealzBot** 
 
 Your trusted escrow service for secure cryptocurrency transactions!
@@ -48,54 +182,125 @@ Your trusted escrow service for secure cryptocurrency transactions!
 
 Choose an option below to get started:
 """
+
+# /help message
+HELP_TEXT = """
+🤖 **SecureDealzBot Help**
+
+**Commands:**
+/start - Main menu
+/help - This help message
+
+**Features:**
+• Secure escrow transactions
+• Multi-crypto support (USDT, BTC, LTC)
+• Dispute resolution
+• Top seller verification
+
+**Support:** Available 24/7
+"""
+
+# Main menu keyboard - static, so built once and shared by every /start
+MAIN_MENU_KEYBOARD = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("🔗 Create Deal", callback_data="create_deal"),
+        InlineKeyboardButton("💰 My Wallet", callback_data="wallet")
+    ],
+    [
+        InlineKeyboardButton("📋 Active Deals", callback_data="my_deals"),
+        InlineKeyboardButton("⭐ Top Sellers", callback_data="top_sellers")
+    ],
+    [
+        InlineKeyboardButton("📞 Support", callback_data="help"),
+        InlineKeyboardButton("📚 User Guide", callback_data="guide")
+    ]
+])
+
+# Single "Go Back" button shown under every menu page
+BACK_TO_MENU_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("← Go Back", callback_data="start")]])
+
+# Menu button pages, keyed by callback_data
+MENU_PAGES = {
+    "create_deal": "🔗 **Create New Deal**\n\nComing soon! This feature is being finalized.",
+    "wallet": "💰 **My Wallet**\n\nWallet features coming soon!",
+    "my_deals": "📋 **Active Deals**\n\nNo active deals found.",
+    "top_sellers": "⭐ **Top Sellers**\n\nTop sellers list coming soon!",
+    "help": "📞 **Support**\n\nFor support, please contact our team.",
+    "guide": "📚 **User Guide**\n\nDetailed guide coming soon!",
+}
+
+class SimpleBotHandler:
+    # Upper bound on remembered Telegram ids (~100 bytes each)
+    KNOWN_USERS_MAX = 50000
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        # LRU of Telegram ids already stored in the users table; only touched on the event loop
+        self.known_users = OrderedDict()
+        
+    async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /start command"""
+        try:
+            user = update.effective_user
+            chat_id = update.effective_chat.id
             
-            # Create main menu keyboard
-            keyboard = [
-                [
-                    InlineKeyboardButton("🔗 Create Deal", callback_data="create_deal"),
-                    InlineKeyboardButton("💰 My Wallet", callback_data="wallet")
-                ],
-                [
-                    InlineKeyboardButton("📋 Active Deals", callback_data="my_deals"),
-                    InlineKeyboardButton("⭐ Top Sellers", callback_data="top_sellers")
-                ],
-                [
-                    InlineKeyboardButton("📞 Support", callback_data="help"),
-                    InlineKeyboardButton("📚 User Guide", callback_data="guide")
-                ]
+            pending = [
+                context.bot.send_message(
+                    chat_id=chat_id,
+                    text=WELCOME_TEXT,
+                    parse_mode='Markdown',
+                    reply_markup=MAIN_MENU_KEYBOARD
+                )
             ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
             
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text=welcome_msg,
-                parse_mode='Markdown',
-                reply_markup=reply_markup
-            )
+            # Create user in database if needed (blocking driver - keep it off the event loop)
+            needs_insert = self.flask_app and not self.is_known_user(user.id)
+            if needs_insert:
+                pending.append(asyncio.to_thread(self.ensure_user, user))
             
-            # Create user in database if needed
-            if self.flask_app:
-                with self.flask_app.app_context():
-                    existing_user = User.query.filter_by(telegram_id=str(user.id)).first()
-                    if not existing_user:
-                        new_user = User(
-                            telegram_id=str(user.id),
-                            username=user.username or '',
-                            first_name=user.first_name or '',
-                            last_name=user.last_name or '',
-                            is_admin=False
-                        )
-                        db.session.add(new_user)
-                        db.session.commit()
-                        logger.info(f"Created new user: {user.first_name}")
+            # The welcome message and the user insert are independent - overlap them
+            await asyncio.gather(*pending)
+            if needs_insert:
+                self.remember_user(user.id)
                         
         except Exception as e:
-            logger.error(f"Error in start_command: {e}")
+            logger.error("Error in start_command: %s", e)
             await context.bot.send_message(
                 chat_id=update.effective_chat.id,
                 text="Welcome to SecureDealzBot! ⚡"
             )
 
+    def is_known_user(self, telegram_id):
+        """Whether this Telegram user is already known to exist in the database"""
+        if telegram_id in self.known_users:
+            self.known_users.move_to_end(telegram_id)
+            return True
+        return False
+
+    def remember_user(self, telegram_id):
+        """Record a Telegram user as stored, evicting the least recently seen if full"""
+        self.known_users[telegram_id] = None
+        self.known_users.move_to_end(telegram_id)
+        if len(self.known_users) > self.KNOWN_USERS_MAX:
+            self.known_users.popitem(last=False)
+
+    def ensure_user(self, user):
+        """Create the database user for a Telegram user if it does not exist yet"""
+        # One INSERT ... ON CONFLICT DO NOTHING instead of SELECT-then-INSERT, so two
+        # concurrent /start presses from a new user cannot race into a duplicate
+        stmt = pg_insert(User).values(
+            telegram_id=str(user.id),
+            username=user.username or '',
+            first_name=user.first_name or '',
+            last_name=user.last_name or '',
+            is_admin=False
+        ).on_conflict_do_nothing(index_elements=['telegram_id'])
+        with self.flask_app.app_context():
+            result = db.session.execute(stmt)
+            db.session.commit()
+            if result.rowcount:
+                logger.info("Created new user: %s", user.first_name)
+
     async def button_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle button callbacks"""
         try:
@@ -105,59 +310,59 @@ Choose an option below to get started:
             callback_data = query.data
             chat_id = query.message.chat_id
             
-            if callback_data == "create_deal":
-                msg = "🔗 **Create New Deal**\n\nComing soon! This feature is being finalized."
-            elif callback_data == "wallet":
-                msg = "💰 **My Wallet**\n\nWallet features coming soon!"
-            elif callback_data == "my_deals":
-                msg = "📋 **Active Deals**\n\nNo active deals found."
-            elif callback_data == "top_sellers":
-                msg = "⭐ **Top Sellers**\n\nTop sellers list coming soon!"
-            elif callback_data == "help":
-                msg = "📞 **Support**\n\nFor support, please contact our team."
-            elif callback_data == "guide":
-                msg = "📚 **User Guide**\n\nDetailed guide coming soon!"
-            else:
-                msg = "Feature coming soon!"
-                
-            # Go back button
-            keyboard = [[InlineKeyboardButton("← Go Back", callback_data="start")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
             if callback_data == "start":
                 # Return to main menu
                 await self.start_command(update, context)
                 return
                 
+            msg = MENU_PAGES.get(callback_data, "Feature coming soon!")
+            
             await context.bot.edit_message_text(
                 chat_id=chat_id,
                 message_id=query.message.message_id,
                 text=msg,
                 parse_mode='Markdown',
-                reply_markup=reply_markup
+                reply_markup=BACK_TO_MENU_KEYBOARD
             )
             
         except Exception as e:
-            logger.error(f"Error in button_handler: {e}")
+            logger.error("Error in button_handler: %s", e)
 
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /help command"""
-        help_text = """
-🤖 **SecureDealzBot Help**
+        await update.message.reply_text(HELP_TEXT, parse_mode='Markdown')
 
-**Commands:**
-/start - Main menu
-/help - This help message
+class ChatUpdateRouter:
+    """Process updates in order per chat while different chats run concurrently"""
 
-**Features:**
-• Secure escrow transactions
-• Multi-crypto support (USDT, BTC, LTC)
-• Dispute resolution
-• Top seller verification
+    def __init__(self, application):
+        self.application = application
+        # chat_id -> [lock, number of updates holding or waiting for it]; dropped when idle
+        self._chats = {}
 
-**Support:** Available 24/7
-"""
-        await update.message.reply_text(help_text, parse_mode='Markdown')
+    async def submit(self, update):
+        """Process an update once earlier updates from the same chat have finished"""
+        chat = update.effective_chat
+        if chat is None:
+            await self._process(update)
+            return
+        entry = self._chats.get(chat.id)
+        if entry is None:
+            entry = self._chats[chat.id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await self._process(update)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chats[chat.id]
+
+    async def _process(self, update):
+        try:
+            await self.application.process_update(update)
+        except Exception as e:
+            logger.error("Error processing update %s: %s", update.update_id, e)
 
 def create_simple_application(flask_app):
     """Create a simple telegram application"""
@@ -165,8 +370,24 @@ def create_simple_application(flask_app):
         logger.error("BOT_TOKEN not found")
         return None, None
         
-    # Create application
-    application = Application.builder().token(BOT_TOKEN).build()
+    # Create application - outgoing calls are throttled to Telegram's flood limits
+    # (30 msg/s overall, 20 msg/min per group); a RetryAfter that still gets through
+    # is retried after the server-provided delay instead of failing the handler
+    rate_limiter = AIORateLimiter(
+        overall_max_rate=30,
+        overall_time_period=1,
+        group_max_rate=20,
+        group_time_period=60,
+        max_retries=3
+    )
+    # HTTP/2 multiplexes concurrent Bot API calls over one TLS connection
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .rate_limiter(rate_limiter)
+        .http_version("2")
+        .build()
+    )
     
     # Create handler
     handler = SimpleBotHandler(flask_app)
@@ -200,9 +421,10 @@ def initialize_simple_bot(flask_app):
         # Store in flask app for webhook handling
         flask_app.telegram_application = application
         flask_app.bot_handler = handler
+        update_router = ChatUpdateRouter(application)
         
-        # Create event loop
-        flask_app.event_loop = asyncio.new_event_loop()
+        # Create event loop (libuv-based when uvloop is installed)
+        flask_app.event_loop = uvloop.new_event_loop() if uvloop else asyncio.new_event_loop()
         
         def run_event_loop():
             asyncio.set_event_loop(flask_app.event_loop)
@@ -222,10 +444,11 @@ def initialize_simple_bot(flask_app):
         # Run initialization
         future = asyncio.run_coroutine_threadsafe(init_app(), flask_app.event_loop)
         future.result(timeout=20)
+        flask_app.update_router = update_router
         
         logger.info("🎉 Simple SecureDealz Bot ready for Railway!")
         return True
         
     except Exception as e:
-        logger.error(f"❌ Simple bot initialization failed: {e}")
+        logger.error("❌ Simple bot initialization failed: %s", e)
         return False
\ No newline at end of file
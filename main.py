@@ -5,9 +5,8 @@ IMPORTANT: For Railway deployment, use railway_simple.py instead of this file
 import os
 import asyncio
 import logging
-import threading
 from flask import Flask, request, jsonify
-from models import db, User
+from models import db, User, create_missing_indexes
 # Removed nowpayments integration - using manual processing
 
 # Create the Flask app
@@ -33,9 +32,10 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
 # Initialize the database
 db.init_app(app)
 
-# Create all tables
+# Create all tables (and any indexes added to existing tables since)
 with app.app_context():
     db.create_all()
+    create_missing_indexes(db.engine)
 
 
 @app.route('/')
@@ -75,7 +75,7 @@ def webhook():
         
             provided_token = request.headers.get("X-Telegram-Bot-Api-Secret-Token")
             if not provided_token or provided_token != telegram_secret_token:
-                logging.warning(f"Webhook access denied - invalid secret token from {request.remote_addr}")
+                logging.warning("Webhook access denied - invalid secret token from %s", request.remote_addr)
                 return {'error': 'Unauthorized'}, 403
         
         # Check bot readiness
@@ -88,29 +88,20 @@ def webhook():
         if request.content_type == 'application/json':
             json_data = request.get_json()
             # Process the webhook update asynchronously
-            try:
-                from telegram import Update
-                update = Update.de_json(json_data, telegram_app.bot)
-            except ImportError:
-                # Fallback - process as raw JSON in deployment
-                import json
-                logging.info(f"Processing webhook with raw JSON: {json_data}")
-                # Create a simple update object
-                class SimpleUpdate:
-                    def __init__(self, data):
-                        self.update_id = data.get('update_id', 0)
-                        self.message = data.get('message')
-                        self.callback_query = data.get('callback_query')
-                update = SimpleUpdate(json_data)
-            asyncio.run_coroutine_threadsafe(
-                telegram_app.process_update(update),
-                event_loop
-            )
+            from telegram import Update
+            update = Update.de_json(json_data, telegram_app.bot)
+            # Route through the per-chat locks so one chat's updates stay in order
+            update_router = getattr(app, 'update_router', None)
+            if update_router:
+                coro = update_router.submit(update)
+            else:
+                coro = telegram_app.process_update(update)
+            asyncio.run_coroutine_threadsafe(coro, event_loop)
             return {'status': 'ok'}, 200
         else:
             return {'error': 'Content-Type must be application/json'}, 400
     except Exception as e:
-        logging.error(f"Webhook error: {e}")
+        logging.error("Webhook error: %s", e)
         return {'error': 'Internal server error'}, 500
 
 
@@ -128,7 +119,7 @@ def set_webhook():
             provided_secret = request.json.get('admin_secret')
         
         if not provided_secret or provided_secret != admin_secret:
-            logging.warning(f"Unauthorized webhook admin access attempt from {request.remote_addr}")
+            logging.warning("Unauthorized webhook admin access attempt from %s", request.remote_addr)
             return {'error': 'Unauthorized'}, 403
         
         # Check bot readiness
@@ -160,15 +151,15 @@ def set_webhook():
                 )
             try:
                 future.result(timeout=30)  # Wait for completion
-                logging.info(f"Webhook successfully set to: {webhook_url}")
+                logging.info("Webhook successfully set to: %s", webhook_url)
                 return {'status': 'webhook_set', 'url': webhook_url}, 200
             except Exception as webhook_error:
-                logging.error(f"Failed to set webhook: {webhook_error}")
+                logging.error("Failed to set webhook: %s", webhook_error)
                 return {'error': f'Webhook setup failed: {str(webhook_error)}'}, 500
         else:
             return {'error': 'webhook_url required'}, 400
     except Exception as e:
-        logging.error(f"Set webhook error: {e}")
+        logging.error("Set webhook error: %s", e)
         return {'error': str(e)}, 500
 
 
@@ -205,7 +196,7 @@ def webhook_info():
         
         provided_secret = auth_header[7:]  # Remove 'Bearer ' prefix
         if provided_secret != admin_secret:
-            logging.warning(f"Unauthorized webhook info access attempt from {request.remote_addr}")
+            logging.warning("Unauthorized webhook info access attempt from %s", request.remote_addr)
             return {'error': 'Unauthorized'}, 403
         
         telegram_app = getattr(app, 'telegram_application', None)
@@ -233,17 +224,13 @@ def webhook_info():
         result = future.result(timeout=30)
         return {"status": "success", "webhook_info": result}, 200
     except Exception as e:
-        logging.error(f"Get webhook info error: {e}")
+        logging.error("Get webhook info error: %s", e)
         return {'error': str(e)}, 500
 
 
 if __name__ == '__main__':
     # Initialize bot for webhook mode
     try:
-        import asyncio
-        import threading
-        import logging
-        import os
         from bot_simple import initialize_simple_bot
         
         # Initialize bot for webhook mode
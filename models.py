@@ -2,11 +2,14 @@
 Database models for the Telegram Escrow Bot
 """
 import os
+import string
+import secrets
+import threading
 from datetime import datetime
 from enum import Enum
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
-from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Float, Text, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Float, Text, Boolean, ForeignKey, Index
 from sqlalchemy.orm import relationship
 
 
@@ -17,6 +20,74 @@ class Base(DeclarativeBase):
 db = SQLAlchemy(model_class=Base)
 
 
+def create_missing_indexes(engine):
+    """Create declared indexes missing from an existing database (create_all only indexes new tables)"""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+ID_ALPHABET = string.ascii_uppercase + string.digits
+
+# Random bytes are drawn from the OS in bulk and handed out in slices, so one
+# getrandom() call covers hundreds of IDs
+_ID_POOL_SIZE = 4096
+_id_pool = bytearray()
+_id_pool_lock = threading.Lock()
+
+
+def _reset_id_pool():
+    """Forked children must not reuse the parent's random bytes (or inherit a held lock)"""
+    global _id_pool_lock
+    _id_pool_lock = threading.Lock()
+    _id_pool.clear()
+
+
+if hasattr(os, 'register_at_fork'):  # POSIX only
+    os.register_at_fork(after_in_child=_reset_id_pool)
+
+
+def _id_table(alphabet):
+    """Byte translation table onto alphabet, plus the bytes to reject to avoid modulo bias"""
+    usable = 256 - 256 % len(alphabet)
+    table = bytes(ord(alphabet[b % len(alphabet)]) for b in range(256))
+    return table, bytes(range(usable, 256))
+
+
+_ALNUM_TABLE = _id_table(ID_ALPHABET)
+# Mixed case for deal IDs: 62^8 ~ 2.2e14 keeps collisions negligible without a pre-insert lookup
+_DEAL_ID_TABLE = _id_table(string.ascii_letters + string.digits)
+_DIGIT_TABLE = _id_table(string.digits)
+
+
+def _random_id(length, id_table=_ALNUM_TABLE):
+    table, rejected = id_table
+    result = b''
+    with _id_pool_lock:
+        while len(result) < length:
+            if len(_id_pool) < length:
+                _id_pool.extend(secrets.token_bytes(_ID_POOL_SIZE))
+            chunk = bytes(_id_pool[:length])
+            del _id_pool[:length]
+            result += chunk.translate(table, rejected)
+    return result[:length].decode('ascii')
+
+
+def generate_deal_id():
+    """Short readable deal ID, e.g. 7kQ2m9XA"""
+    return _random_id(8, _DEAL_ID_TABLE)
+
+
+def generate_transaction_id():
+    """Transaction reference, e.g. TXN4F8Q2M9XA7KB1C"""
+    return f"TXN{_random_id(12)}"
+
+
+def generate_withdrawal_id():
+    """Numeric withdrawal request ID, e.g. 40817263"""
+    return _random_id(8, _DIGIT_TABLE)
+
+
 class DealStatus(Enum):
     PENDING = "pending"
     ACCEPTED = "accepted"
@@ -87,9 +158,15 @@ class User(db.Model):
 
 class Deal(db.Model):
     __tablename__ = 'deals'
+    __table_args__ = (
+        # Per-user deal lists: filter by party + status, newest first
+        Index('ix_deal_buyer_status_created', 'buyer_id', 'status', 'created_at'),
+        Index('ix_deal_seller_status_created', 'seller_id', 'status', 'created_at'),
+        Index('ix_deal_status_completed_at', 'status', 'completed_at'),
+    )
     
     id = Column(Integer, primary_key=True)
-    deal_id = Column(String(20), unique=True, nullable=False)  # Short readable ID
+    deal_id = Column(String(20), unique=True, nullable=False, default=generate_deal_id)  # Short readable ID
     title = Column(String(200), nullable=False)
     description = Column(Text, nullable=True)
     amount = Column(Float, nullable=False)
@@ -126,7 +203,7 @@ class Transaction(db.Model):
     __tablename__ = 'transactions'
     
     id = Column(Integer, primary_key=True)
-    transaction_id = Column(String(50), unique=True, nullable=False)
+    transaction_id = Column(String(50), unique=True, nullable=False, default=generate_transaction_id)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     deal_id = Column(Integer, ForeignKey('deals.id'), nullable=True)
     
@@ -201,7 +278,7 @@ class WithdrawalRequest(db.Model):
     __tablename__ = 'withdrawal_requests'
     
     id = Column(Integer, primary_key=True)
-    request_id = Column(String(20), unique=True, nullable=False)  # Short readable ID
+    request_id = Column(String(20), unique=True, nullable=False, default=generate_withdrawal_id)  # Short readable ID
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     
     amount = Column(Float, nullable=False)
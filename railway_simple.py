@@ -37,9 +37,9 @@ def main():
         
         # Import and initialize bot
         logger.info("🤖 Initializing Telegram bot...")
-        from bot import initialize_bot_webhook
+        from bot_simple import initialize_simple_bot
         
-        if not initialize_bot_webhook(app):
+        if not initialize_simple_bot(app):
             logger.error("❌ Failed to initialize bot webhook")
             sys.exit(1)
             
@@ -49,7 +49,7 @@ def main():
         port = int(os.environ.get("PORT", 5000))
         host = "0.0.0.0"
         
-        logger.info(f"🌐 Starting Flask server on {host}:{port}")
+        logger.info("🌐 Starting Flask server on %s:%s", host, port)
         logger.info("🎯 Railway deployment ready!")
         
         # Start Flask app with error handling
@@ -62,12 +62,12 @@ def main():
         )
         
     except ImportError as e:
-        logger.error(f"❌ Import error: {e}")
+        logger.error("❌ Import error: %s", e)
         logger.error("Make sure all files are uploaded to GitHub and Railway can access them")
         sys.exit(1)
         
     except Exception as e:
-        logger.error(f"❌ Startup error: {e}")
+        logger.error("❌ Startup error: %s", e)
         import traceback
         traceback.print_exc()
         sys.exit(1)